@@ -9,7 +9,7 @@ ALS.com Arc'teryx 监控（精简稳定版 / 无任何“上新过多”抑制
 
 保证：
   - 只通知有变化的商品（绝不推送无变化）
-  - 一个商品一条通知（同一商品多种变化合并）
+  - 一个商品一条通知（同一商品多种变化合并；多条通知按 10 条一批合并发送）
   - 稳定 key = PDP 规范化 URL 的 slug（/xxx/p ⇒ xxx）
   - 快照原子写入
 
@@ -17,9 +17,15 @@ Env:
   DISCORD_WEBHOOK_URL   必填：Discord Webhook
   HEADLESS=0/1          可选：本地 0，CI 1（默认 1）
   KEYWORD_FILTER        可选：只监控标题包含该关键词（不区分大小写）
-  NOTIFY_INTERVAL_SEC   可选：每条通知间隔，默认 0.1 秒
+  NOTIFY_INTERVAL_SEC   可选：每条通知最小间隔，默认 0（额度耗尽时按 Discord 限速头等待）
+  SCRAPE_CONCURRENCY    可选：并发解析 PDP 的页面数，默认 8
+  ALS_MIN_INTERVAL_SEC  可选：对 als.com 的请求最小间隔，默认 0.1 秒
+  SNAPSHOT_FSYNC=0/1    可选：写快照时是否 fsync（默认 0）
+  LISTING_TRIAGE=0/1    可选：集合页价格/有货与快照一致时跳过 PDP（默认 1）
+  PW_USER_DATA_DIR      可选：浏览器持久化目录（缓存/cookie 跨次复用），默认 .pwcache
 """
 
+import asyncio
 import json
 import os
 import re
@@ -27,22 +33,113 @@ import sys
 import time
 import math
 import random
-import shutil
+import hashlib
+import functools
+import http.client
 from datetime import datetime, timezone
+from html import unescape
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Dict, Any, List, Tuple, Set
-from urllib.parse import urlparse
+from typing import Awaitable, Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple, Set
+from urllib.parse import urljoin, urlparse
 
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+import orjson
+from playwright.async_api import async_playwright, TimeoutError as PWTimeout
 
 COLLECTION_URL = "https://www.als.com/arc-teryx"
 SNAPSHOT_PATH = Path("snapshot.json")
+PW_USER_DATA_DIR = os.getenv("PW_USER_DATA_DIR", ".pwcache")
+DISCORD_RETRIES = 3
+HTTP_RETRIES = 3
+_DISCORD_CONNS: Dict[str, http.client.HTTPSConnection] = {}
+_DISCORD_BUCKETS: Dict[str, str] = {}       # webhook 路径 -> X-RateLimit-Bucket
+_DISCORD_RESUME_AT: Dict[str, float] = {}   # bucket -> 可再次发送的 monotonic 时刻
+_now_iso_cache: Tuple[int, str] = (0, "")
+
+# 拦截：静态资源/信标等 + 统计/埋点第三方 + 子框架文档
+_BLOCKED_RESOURCE_TYPES = ("image", "media", "font", "stylesheet", "other")
+_TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "segment.io", "segment.com",
+    "sentry.io", "doubleclick.net", "facebook.net", "cloudflareinsights.com",
+    "hotjar.com", "hotjar.io",
+)
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
 )
 
+# 预编译正则（解析热路径上反复调用）
+_RE_SPACES = re.compile(r"\s+")
+_RE_MONEY = re.compile(r"([A-Z]{2}\$|\$|CA\$|US\$|€|£|¥)\s*([0-9]+(?:\.[0-9]{2})?)")
+_RE_NUM = re.compile(r"([0-9]+(?:\.[0-9]{2})?)")
+_RE_SKU_X = re.compile(r"(X\d{9,12})", re.ASCII)
+_RE_SKU_LABEL = re.compile(r"(?:SKU|Style|Model)\s*[:#]\s*([A-Za-z0-9\-]+)", re.I)
+_RE_CART_BUTTON = re.compile(r"(Add to cart|Add to bag)", re.I)
+_RE_PAREN_TAIL = re.compile(r"\(([^()]+)\)$")
+_RE_PDP_HREF = re.compile(r"""href\s*=\s*["']([^"']*/arcteryx-[^"']*)["']""", re.I | re.ASCII)
+_RE_TAGS = re.compile(r"<[^>]+>")
+_RE_OOS_BADGE = re.compile(r"sold\s*out|out\s+of\s+stock", re.I)
+_RE_LD_SCRIPT = re.compile(r"<script[^>]*application/ld\+json[^>]*>(.*?)</script>", re.I | re.S | re.ASCII)
+# 字母尺码 + 均码；数字尺码（裤腰 30/32 等，1~2 位数字）在页面内按正则判断
+_SIZE_LABELS = frozenset(("XXS", "XS", "S", "M", "L", "XL", "XXL", "XXXL", "ONE SIZE", "OS", "O/S"))
+_LD_IN_STOCK = frozenset(("InStock", "LimitedAvailability", "OnlineOnly"))
+
+_SIZE_BUTTONS_JS = r"""labels => {
+    const sizes = new Set(labels);
+    return Array.from(document.querySelectorAll("button"))
+        .map(b => ({
+            t: (b.innerText || "").trim().toUpperCase(),
+            d: b.disabled || ["true", "disabled"].includes(b.getAttribute("aria-disabled"))
+                || (typeof b.className === "string" && b.className.includes("disabled")),
+        }))
+        .filter(x => (sizes.has(x.t) || /^\d{1,2}$/.test(x.t)) && !x.d)
+        .map(x => x.t);
+}"""
+
+_LISTING_CARDS_JS = """els => els
+    .map(e => {
+        const card = e.closest("li, article, [class*='product-card'], [class*='productCard'], [class*='tile']") || e;
+        return {href: e.href.split("#")[0], text: (card.innerText || "").slice(0, 500)};
+    })
+    .filter(x => x.href.includes("als.com"))"""
+
+# 商品数据就绪：有标题，且 ld+json Product / 价格节点 / 尺码按钮之一已出现（均码商品可能没有尺码按钮）
+_PDP_READY_JS = r"""labels => {
+    if (!document.querySelector("h1")) return false;
+    if (Array.from(document.querySelectorAll("script[type='application/ld+json']"))
+            .some(s => (s.textContent || "").includes("Product"))) return true;
+    if (document.querySelector("[class*='price'], [data-test*='price']")) return true;
+    const sizes = new Set(labels);
+    return Array.from(document.querySelectorAll("button"))
+        .some(b => {
+            const t = (b.innerText || "").trim().toUpperCase();
+            return sizes.has(t) || /^\d{1,2}$/.test(t);
+        });
+}"""
+
+# PDP 所需的全部字段（含可购尺码）一次 evaluate 取回；
+# SKU/颜色行在页面内匹配好再回传，不把整页 innerText 经 CDP 传回来
+_PDP_JS = r"""labels => {
+    const text = document.body?.innerText || "";
+    const skuEl = document.querySelector("[itemprop='sku']");
+    return {
+        h1: document.querySelector("h1")?.innerText || "",
+        title: document.title || "",
+        sku: [
+            skuEl?.getAttribute("content") || skuEl?.textContent || "",
+            (text.match(/X\d{9,12}/) || text.match(/(?:SKU|Style|Model)\s*[:#]\s*[A-Za-z0-9\-]+/i) || [""])[0],
+        ],
+        colorLine: (text.match(/Color\s*:\s*(.+)/i) || [])[1] || "",
+        ld: Array.from(document.querySelectorAll("script[type='application/ld+json']"))
+            .slice(0, 8).map(s => s.textContent || ""),
+        priceEls: Array.from(document.querySelectorAll("[class*='price'], [data-test*='price']"))
+            .slice(0, 4).map(e => e.innerText || ""),
+        selected: Array.from(document.querySelectorAll("[aria-pressed='true'], [aria-selected='true']"))
+            .slice(0, 6).map(e => e.innerText || ""),
+        sizes: (""" + _SIZE_BUTTONS_JS + r""")(labels),
+    };
+}"""
+
 # --------------------------
 # 基础工具
 # --------------------------
@@ -50,18 +147,24 @@ USER_AGENT = (
 def jdump(obj: Any, path: Path) -> None:
     """原子写文件，避免半写入导致快照损坏。"""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with NamedTemporaryFile('w', delete=False, encoding='utf-8', dir=str(path.parent)) as tmp:
-        json.dump(obj, tmp, ensure_ascii=False, indent=2)
-        tmp.flush()
-        os.fsync(tmp.fileno())
-        tmp_name = tmp.name
+    tmp = NamedTemporaryFile('wb', delete=False, prefix=path.name + ".tmp.", dir=str(path.parent))
+    # 写入、fsync、rename 任一步失败都清理临时文件
     try:
-        shutil.move(tmp_name, path)
-    finally:
+        with tmp:
+            # 紧凑 JSON（不缩进）：体积更小、读写更快；orjson 直接输出 UTF-8
+            tmp.write(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS))
+            tmp.flush()
+            # 快照可由下次抓取重建，默认不 fsync；需要掉电持久性时设 SNAPSHOT_FSYNC=1
+            if os.environ.get("SNAPSHOT_FSYNC", "0") == "1":
+                os.fsync(tmp.fileno())
+        # 同目录 rename 是原子的
+        os.replace(tmp.name, path)
+    except BaseException:
         try:
-            os.unlink(tmp_name)
-        except Exception:
+            os.unlink(tmp.name)
+        except OSError:
             pass
+        raise
 
 
 def jload(path: Path) -> Dict[str, Any]:
@@ -69,7 +172,12 @@ def jload(path: Path) -> Dict[str, Any]:
         print(f"[snapshot] {path} not found.")
         return {}
     try:
-        data = json.loads(path.read_text(encoding="utf-8"))
+        raw = path.read_bytes()
+        try:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # 旧快照由 json.dump 写出，可能含 orjson 不接受的 NaN 字面量
+            data = json.loads(raw)
         print(f"[snapshot] loaded {len(data)} items from {path}.")
         return data
     except Exception as e:
@@ -77,162 +185,317 @@ def jload(path: Path) -> Dict[str, Any]:
         return {}
 
 
-def safe_sleep(a: float = 0.06, b: float = 0.18) -> None:
-    time.sleep(random.uniform(a, b))
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """指数退避：min(cap, base * 2^attempt) + 抖动。"""
+    return min(cap, base * 2 ** attempt) + random.uniform(0, base)
+
+
+def retry_after_sec(getheader: Callable[[str], Optional[str]]) -> float:
+    """解析 Retry-After / X-RateLimit-Reset-After（秒）；没有或无法解析时返回 0。"""
+    for name in ("Retry-After", "X-RateLimit-Reset-After"):
+        try:
+            return max(0.0, float(getheader(name) or ""))
+        except ValueError:
+            continue
+    return 0.0
+
+
+class HostRateLimiter:
+    """同一站点的请求最小间隔（带抖动）；遇到限流时整体暂停。协程间共享。"""
+
+    def __init__(self, min_interval: float, jitter: float = 0.1) -> None:
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(now, self._next) + self.min_interval + random.uniform(0, self.jitter)
+
+    def pause(self, seconds: float) -> None:
+        self._next = max(self._next, time.monotonic() + seconds)
 
 
 def now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+    """UTC ISO 时间（秒级）；同一秒内复用缓存字符串。"""
+    global _now_iso_cache
+    sec = int(time.time())
+    if sec != _now_iso_cache[0]:
+        _now_iso_cache = (sec, datetime.fromtimestamp(sec, timezone.utc).isoformat())
+    return _now_iso_cache[1]
 
 
 def norm_spaces(s: str) -> str:
-    return re.sub(r"\s+", " ", s or "").strip()
+    return _RE_SPACES.sub(" ", s or "").strip()
 
 
+@functools.lru_cache(maxsize=4096)
 def slug_from_pdp_url(u: str) -> str:
-    """从 PDP URL 取 slug：/arcteryx-xxx/p -> arcteryx-xxx"""
-    try:
-        p = urlparse(u)
-        path = (p.path or "").lower()
-        m = re.search(r"/([^/]+)/p(?:$|/|\?|#)", path)
-        return m.group(1) if m else path.strip("/").split("/")[-1]
-    except Exception:
-        u2 = (u or "").split("?")[0].split("#")[0].lower()
-        return u2.strip("/").split("/")[-1]
-
-
+    """从 PDP URL 取 slug：/arcteryx-xxx/p -> arcteryx-xxx（纯字符串操作，不走 urlparse/正则）"""
+    path = (u or "").split("?", 1)[0].split("#", 1)[0].lower()
+    if "://" in path:
+        rest = path.split("://", 1)[1]
+        slash = rest.find("/")
+        path = rest[slash:] if slash >= 0 else ""
+    # 第一个独立的 "/p" 段，其前一段即 slug
+    i = path.find("/p")
+    while i >= 0:
+        end = i + 2
+        if i > 0 and (end == len(path) or path[end] == "/"):
+            seg = path[:i].rsplit("/", 1)[-1]
+            if seg:
+                return seg
+        i = path.find("/p", i + 1)
+    return path.strip("/").split("/")[-1]
+
+
+@functools.lru_cache(maxsize=4096)
 def stable_key_from_url(u: str) -> str:
     """稳定 key：仅用 PDP slug，避免标题/SKU/颜色抖动。"""
     slug = slug_from_pdp_url(u)
     return slug or (u or "").lower()
 
+
+def product_fingerprint(data: Dict[str, Any]) -> str:
+    """价格/库存/尺码的稳定摘要（跨进程一致，可写入快照），用于 diff 快速跳过未变商品。"""
+    price = data.get("price")
+    sig = repr((round(price, 2) if price is not None else None, bool(data.get("in_stock")), tuple(data.get("sizes_avail") or ())))
+    return hashlib.blake2b(sig.encode("utf-8"), digest_size=8).hexdigest()
+
 # --------------------------
 # 抓取解析
 # --------------------------
 
-def extract_collection_links(page) -> List[str]:
-    """集合页抓取到 PDP 链接列表。"""
+def _listing_item(href: str, card_text: str, before_text: str = "") -> Dict[str, Any]:
+    """
+    集合页单个商品卡片：链接 + 卡片上的全部价格/缺货标记（用于决定是否需要进 PDP）。
+    before_text 为链接之前、归属不明的文本：只用于缺货标记（宁可多进 PDP，不漏到货）。
+    """
+    prices = [float(m.group(2)) for m in _RE_MONEY.finditer(card_text.replace(",", ""))]
+    return {
+        "href": href,
+        "prices": list(dict.fromkeys(prices)),   # 打折卡片会同时显示原价与折后价
+        "oos": bool(_RE_OOS_BADGE.search(card_text) or _RE_OOS_BADGE.search(before_text)),
+    }
+
+
+def _dedup_listing(items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按 href 去重（保持顺序）；同一商品多个锚点时合并价格/缺货信息。"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for it in items:
+        cur = merged.get(it["href"])
+        if cur is None:
+            merged[it["href"]] = it
+        else:
+            cur["prices"] = list(dict.fromkeys(cur["prices"] + it["prices"]))
+            cur["oos"] = cur["oos"] or it["oos"]
+    return list(merged.values())
+
+
+async def extract_collection_links(page) -> List[Dict[str, Any]]:
+    """集合页抓取到 PDP 链接列表（含卡片价格/缺货标记）。"""
     anchors = page.locator("a[href*='/arcteryx-'][href*='/p']")
-    hrefs = anchors.evaluate_all("els => els.map(e => e.href)")
-    uniq: List[str] = []
-    for h in hrefs:
-        if "als.com" in h:
-            h = h.split("#")[0]
-            if h not in uniq:
-                uniq.append(h)
-    return uniq
-
-
-def extract_price(page) -> Tuple[str, float]:
-    """货币与价格（尽量简单稳健）。"""
-    for sel in [
-        "[class*='price']",
-        "[data-test*='price']",
-        "div:has-text('$'), div:has-text('CA$'), div:has-text('US$'), div:has-text('€'), div:has-text('£'), div:has-text('¥')",
-        "body",
-    ]:
+    # 过滤与去掉 #fragment 放在页面内完成，少传数据
+    rows = await anchors.evaluate_all(_LISTING_CARDS_JS)
+    return _dedup_listing(_listing_item(r["href"], r.get("text") or "") for r in rows)
+
+
+def iter_ld_nodes(ld_blocks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """逐块惰性解析 ld+json，依次产出其中的对象节点（展开顶层列表与 @graph）。"""
+    for raw in ld_blocks:
         try:
-            if page.locator(sel).count():
-                txt = page.locator(sel).first.inner_text()
-                txt = txt.replace(",", "")
-                m = re.search(r"([A-Z]{2}\$|\$|CA\$|US\$|€|£|¥)\s*([0-9]+(?:\.[0-9]{2})?)", txt)
-                if m:
-                    return m.group(1), float(m.group(2))
-                m = re.search(r"([0-9]+(?:\.[0-9]{2})?)", txt)
-                if m:
-                    return "", float(m.group(1))
-        except Exception:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            continue
+        stack = [data]
+        while stack:
+            node = stack.pop(0)
+            if isinstance(node, list):
+                stack[:0] = node
+            elif isinstance(node, dict):
+                yield node
+                if isinstance(node.get("@graph"), list):
+                    stack[:0] = node["@graph"]
+
+
+def extract_collection_links_html(html: str, base_url: str) -> List[Dict[str, Any]]:
+    """
+    从集合页 HTML 源码抓 PDP 链接（与 extract_collection_links 的选择器一致）。
+    卡片文本取该链接到下一个商品链接之间的 HTML（去标签，限长）；
+    与上一个链接之间的 HTML 归属不明（缺货角标可能在链接之前），也参与缺货判断。
+    """
+    matches = list(_RE_PDP_HREF.finditer(html))
+    items: List[Dict[str, Any]] = []
+    for i, m in enumerate(matches):
+        h = m.group(1)
+        if "/p" not in h:
+            continue
+        href = urljoin(base_url, unescape(h)).split("#")[0]
+        if "als.com" not in href:
             continue
-    return "", math.nan
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(html)
+        start = matches[i - 1].end() if i else 0
+        card = unescape(_RE_TAGS.sub(" ", html[m.end():min(end, m.end() + 3000)]))
+        before = unescape(_RE_TAGS.sub(" ", html[max(start, m.start() - 3000):m.start()]))
+        items.append(_listing_item(href, card, before))
+    return _dedup_listing(items)
+
+
+def extract_price(texts: List[str]) -> Tuple[str, Optional[float]]:
+    """货币与价格（尽量简单稳健）：依次尝试价格节点文本，首个命中即返回；取不到价格为 None。"""
+    for txt in texts:
+        if not txt:
+            continue
+        txt = txt.replace(",", "")
+        m = _RE_MONEY.search(txt)
+        if m:
+            return m.group(1), float(m.group(2))
+        m = _RE_NUM.search(txt)
+        if m:
+            return "", float(m.group(1))
+    return "", None
 
 
-def extract_title(page) -> str:
-    try:
-        if page.locator("h1").count():
-            return norm_spaces(page.locator("h1").first.inner_text())
-        if page.locator("title").count():
-            return norm_spaces(page.locator("title").first.inner_text())
-    except Exception:
-        pass
-    return ""
+def extract_title(h1: str, doc_title: str) -> str:
+    return norm_spaces(h1) or norm_spaces(doc_title)
 
 
-def extract_sku(page) -> str:
-    """SKU（简化：匹配 X 开头样式号；退路找 SKU/Style/Model 标记）。"""
-    try:
-        txt = page.locator("body").inner_text()
-        m = re.search(r"(X\d{9,12})", txt)
+def extract_sku(texts: List[str], ld_blocks: List[str]) -> str:
+    """SKU（简化：在页面回传的短文本里匹配 X 开头样式号；退路找 SKU/Style/Model 标记，再退路 ld+json）。"""
+    for txt in texts:
+        m = _RE_SKU_X.search(txt)
         if m:
             return m.group(1).strip()
-        m = re.search(r"(?:SKU|Style|Model)\s*[:#]\s*([A-Za-z0-9\-]+)", txt, re.I)
+    for txt in texts:
+        m = _RE_SKU_LABEL.search(txt)
         if m:
             return m.group(1).strip()
-    except Exception:
-        pass
+    # 不含 "sku" 的块（面包屑、组织信息等）直接跳过，不做 JSON 解析
+    for node in iter_ld_nodes(raw for raw in ld_blocks if '"sku"' in raw):
+        if node.get("sku"):
+            return str(node["sku"]).strip()
     return ""
 
 
-def extract_color(page) -> str:
+def extract_color(color_line: str, selected: List[str], title: str) -> str:
     """颜色（简版：尝试 Color: 行、aria-selected 按钮、标题括号）。"""
-    try:
-        matches = page.locator("text=/Color\\s*:/i")
-        if matches.count():
-            line = matches.first.evaluate("el => el.parentElement ? el.parentElement.innerText : el.innerText")
-            if line:
-                m = re.search(r"Color\s*:\s*(.+)", line, re.I)
-                if m:
-                    return norm_spaces(m.group(1))
-    except Exception:
-        pass
-    try:
-        selected = page.locator("[aria-pressed='true'], [aria-selected='true']")
-        for i in range(min(selected.count(), 6)):
-            t = norm_spaces(selected.nth(i).inner_text())
-            if t and len(t) <= 40 and not re.search(r"(Add to cart|Add to bag)", t, re.I):
-                return t
-    except Exception:
-        pass
-    try:
-        title = extract_title(page)
-        m = re.search(r"\(([^()]+)\)$", title)
-        if m:
-            return norm_spaces(m.group(1))
-    except Exception:
-        pass
+    if color_line:
+        return norm_spaces(color_line)
+    for t in selected:
+        t = norm_spaces(t)
+        if t and len(t) <= 40 and not _RE_CART_BUTTON.search(t):
+            return t
+    m = _RE_PAREN_TAIL.search(title)
+    if m:
+        return norm_spaces(m.group(1))
     return ""
 
 
-def extract_sizes_available(page) -> List[str]:
-    """返回可购尺码列表（只判断可点/不可点，不取数量，避免误报）。"""
-    sizes: List[str] = []
-    try:
-        candidates = page.locator(
-            "button:has-text('XXS'), button:has-text('XS'), button:has-text('S'), "
-            "button:has-text('M'), button:has-text('L'), button:has-text('XL'), "
-            "button:has-text('XXL'), button:has-text('XXXL')"
-        )
-        for i in range(candidates.count()):
-            el = candidates.nth(i)
-            label = norm_spaces(el.inner_text()).upper()
-            if not label:
-                continue
-            disabled = el.get_attribute("disabled")
-            aria = el.get_attribute("aria-disabled")
-            cls = (el.get_attribute("class") or "")
-            if not (disabled is not None or aria in ("true", "disabled") or "disabled" in cls):
-                sizes.append(label)
-    except Exception:
-        pass
-    return sorted(list(dict.fromkeys(sizes)))
-
-
-def parse_product_detail(page) -> Dict[str, Any]:
-    """PDP 解析（简化字段，仅保留必要）。"""
-    title = extract_title(page)
-    sku = extract_sku(page)
-    color = extract_color(page)
-    currency, price = extract_price(page)
-    sizes_avail = extract_sizes_available(page)
+def _ld_offers(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """展开 offers：单个 Offer / Offer 列表 / AggregateOffer.offers。"""
+    offers = node.get("offers")
+    if isinstance(offers, dict):
+        inner = offers.get("offers")
+        if isinstance(inner, list):
+            return [o for o in inner if isinstance(o, dict)] or [offers]
+        return [offers]
+    if isinstance(offers, list):
+        return [o for o in offers if isinstance(o, dict)]
+    return []
+
+
+def _ld_price(offers: List[Dict[str, Any]]) -> Tuple[str, Optional[float]]:
+    for o in offers:
+        raw = o.get("price", o.get("lowPrice"))
+        try:
+            return str(o.get("priceCurrency") or ""), float(str(raw).replace(",", ""))
+        except (TypeError, ValueError):
+            continue
+    return "", None
+
+
+def _ld_available(offers: List[Dict[str, Any]]) -> bool:
+    return any(str(o.get("availability") or "").rsplit("/", 1)[-1] in _LD_IN_STOCK for o in offers)
+
+
+def product_from_ld(ld_blocks: Iterable[str]) -> Optional[Dict[str, Any]]:
+    """
+    从 ld+json 的 Product/ProductGroup 节点取字段；没有该节点返回 None。
+    尺码可购性取自 hasVariant（字母/数字尺码均保留）；没有按尺码的变体时（如均码商品）
+    in_stock 取自 offers 的 availability，sizes_avail 为空列表；变体都没有 availability 时同样退回父级 offers。
+    变体跨多个颜色、或取不到任何 availability 时 sizes_avail/in_stock 为 None。
+    """
+    for node in iter_ld_nodes(ld_blocks):
+        types = node.get("@type")
+        types = types if isinstance(types, list) else [types]
+        if "Product" not in types and "ProductGroup" not in types:
+            continue
+
+        variants = node.get("hasVariant") or []
+        variants = [v for v in (variants if isinstance(variants, list) else [variants]) if isinstance(v, dict)]
+        sized = [v for v in variants if v.get("size")]
+        offers = _ld_offers(node) or [o for v in variants for o in _ld_offers(v)]
+
+        sizes_avail: Optional[List[str]] = None
+        in_stock: Optional[bool] = None
+        node_offers = _ld_offers(node)
+        if sized and any(o.get("availability") for v in sized for o in _ld_offers(v)):
+            if len({str(v.get("color") or "") for v in sized}) == 1:
+                sizes: List[str] = []
+                for v in sized:
+                    size = v["size"].get("name") if isinstance(v["size"], dict) else v["size"]
+                    label = norm_spaces(str(size or "")).upper()
+                    if label and _ld_available(_ld_offers(v)):
+                        sizes.append(label)
+                sizes_avail = sorted(list(dict.fromkeys(sizes)))
+                in_stock = bool(sizes_avail)
+        elif sized:
+            # 变体本身没有 availability（只在父级 AggregateOffer 上）：只能判断整体是否有货
+            if any(o.get("availability") for o in node_offers):
+                sizes_avail, in_stock = [], _ld_available(node_offers)
+        elif any(o.get("availability") for o in offers):
+            sizes_avail, in_stock = [], _ld_available(offers)
+
+        title = norm_spaces(str(node.get("name") or ""))
+        currency, price = _ld_price(offers)
+        color = norm_spaces(str(node.get("color") or (sized[0].get("color") if sized else "") or ""))
+        return {
+            "title": title,
+            "sku": str(node.get("sku") or node.get("productGroupID") or "").strip(),
+            "color": color,
+            "currency": currency,
+            "price": price,
+            "sizes_avail": sizes_avail,
+            "in_stock": in_stock,
+        }
+    return None
+
+
+async def parse_product_detail(page) -> Dict[str, Any]:
+    """
+    PDP 解析（简化字段，仅保留必要）：一次 evaluate 取回所需文本与可购尺码。
+    优先用 ld+json 的 Product 节点，缺失的字段再用页面文本/尺码按钮兜底。
+    """
+    info = await page.evaluate(_PDP_JS, sorted(_SIZE_LABELS))
+    ld_blocks = info.get("ld") or []
+    ld = product_from_ld(ld_blocks) or {}
+
+    title = ld.get("title") or extract_title(info.get("h1") or "", info.get("title") or "")
+    sku = ld.get("sku") or extract_sku(info.get("sku") or [], ld_blocks)
+    color = ld.get("color") or extract_color(info.get("colorLine") or "", info.get("selected") or [], title)
+    if ld.get("price") is not None:
+        currency, price = ld.get("currency") or "", ld["price"]
+    else:
+        currency, price = extract_price(info.get("priceEls") or [])
+    sizes_avail, in_stock = ld.get("sizes_avail"), ld.get("in_stock")
+    if in_stock is None:
+        sizes_avail = sorted(list(dict.fromkeys(info.get("sizes") or [])))
+        in_stock = bool(sizes_avail)
     return {
         "title": title,
         "sku": sku,
@@ -240,127 +503,327 @@ def parse_product_detail(page) -> Dict[str, Any]:
         "currency": currency,
         "price": price,
         "sizes_avail": sizes_avail,          # 可购尺码列表
-        "in_stock": bool(sizes_avail),       # 任一尺码可买即 True
+        "in_stock": in_stock,                # 任一尺码可买（均码商品看 offers）即 True
     }
 
 
-def scrape_all_products(headless: bool = True, timeout_ms: int = 8000) -> Dict[str, Any]:
-    """
-    集合页翻页直到连续2页无链接；逐个 PDP 解析。
-    仅保留必要逻辑：拦截静态资源以提速；每个 PDP 尝试 1 次。
-    key = 稳定 slug。
-    """
-    result: Dict[str, Any] = {}
-    keyword = os.environ.get("KEYWORD_FILTER", "").strip().lower()
+async def _setup_context(ctx, timeout_ms: int):
+    """统一超时，并拦截非必要资源。"""
+    ctx.set_default_timeout(timeout_ms)
 
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(headless=headless, args=["--disable-http-cache"])
-        ctx = browser.new_context(user_agent=USER_AGENT, locale="en-US")
-        ctx.set_default_timeout(timeout_ms)
+    async def _route(route):
+        req = route.request
+        if req.resource_type in _BLOCKED_RESOURCE_TYPES:
+            return await route.abort()
+        if (urlparse(req.url).hostname or "").endswith(_TRACKER_HOSTS):
+            return await route.abort()
+        if req.resource_type == "document" and req.frame.parent_frame is not None:
+            return await route.abort()
+        return await route.continue_()
+    await ctx.route("**/*", _route)
+    return ctx
 
-        # 拦截非必要资源
-        def _route(route):
-            if route.request.resource_type in ("image", "media", "font", "stylesheet"):
-                return route.abort()
-            return route.continue_()
-        ctx.route("**/*", _route)
 
-        page = ctx.new_page()
-        page_idx, empty_hits = 1, 0
-        seen: Set[str] = set()
+async def _collect_links(fetch_links: Callable[[str], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """集合页翻页直到连续2页无链接，返回去重后的商品卡片（保持顺序）。"""
+    links_all: List[Dict[str, Any]] = []
+    seen_slugs: Set[str] = set()
+    page_idx, empty_hits = 1, 0
 
-        while True:
-            url = COLLECTION_URL if page_idx == 1 else f"{COLLECTION_URL}?page={page_idx}"
-            try:
-                page.goto(url)
-                page.wait_for_load_state("domcontentloaded")
-            except PWTimeout:
-                print(f"[list] timeout {url}")
-                empty_hits += 1
-                if empty_hits >= 2:
-                    break
-                page_idx += 1
+    while True:
+        url = COLLECTION_URL if page_idx == 1 else f"{COLLECTION_URL}?page={page_idx}"
+        try:
+            links = await fetch_links(url)
+        except Exception as e:
+            print(f"[list] error {url}: {e}")
+            links = []
+        print(f"[collection] page {page_idx} links: {len(links)}")
+
+        if not links:
+            empty_hits += 1
+            if empty_hits >= 2:
+                break
+            page_idx += 1
+            continue
+
+        before = len(links_all)
+        for item in links:
+            # 同一 PDP 可能带不同查询参数，按 slug 去重
+            slug = slug_from_pdp_url(item["href"])
+            if slug in seen_slugs:
                 continue
+            seen_slugs.add(slug)
+            links_all.append(item)
+        # 整页都是已见过的商品（例如服务端忽略 page 参数）也算空页，避免无限翻页
+        empty_hits = 0 if len(links_all) > before else empty_hits + 1
+        if empty_hits >= 2:
+            break
+        page_idx += 1
 
-            links = extract_collection_links(page)
-            print(f"[collection] page {page_idx} links: {len(links)}")
+    return links_all
 
-            if not links:
-                empty_hits += 1
-                if empty_hits >= 2:
-                    break
-                page_idx += 1
+
+async def _http_get(http, url: str, timeout_ms: int,
+                    limiter: HostRateLimiter) -> Tuple[Optional[str], str, bool]:
+    """
+    限速后 GET 一个页面，返回 (html, 最终 URL, 是否被限流)；失败时 html 为 None。
+    429/503 时整体暂停后重试，最多 HTTP_RETRIES 次；仍被限流则第三项为 True。
+    """
+    for attempt in range(HTTP_RETRIES + 1):
+        await limiter.wait()
+        try:
+            resp = await http.get(url, timeout=timeout_ms)
+            if resp.status in (429, 503):
+                # 被限流：让所有协程一起暂停，到点后重试
+                wait = retry_after_sec(lambda name: resp.headers.get(name.lower())) or backoff_delay(attempt)
+                print(f"[http] throttled {resp.status} {url}; pausing {wait:.1f}s ({attempt + 1}/{HTTP_RETRIES + 1})")
+                limiter.pause(wait)
                 continue
+            if not resp.ok:
+                return None, url, False
+            return await resp.text(), resp.url, False
+        except Exception as e:
+            print(f"[http] error {url}: {e}")
+            return None, url, False
+    return None, url, True
+
+
+async def _fetch_detail_http(http, href: str, timeout_ms: int,
+                             limiter: HostRateLimiter) -> Tuple[Optional[Dict[str, Any]], str, bool]:
+    """不渲染页面：直接 GET PDP 的 HTML，从 ld+json 取字段；取不全返回 (None, href, 是否被限流)。"""
+    html, final_url, throttled = await _http_get(http, href, timeout_ms, limiter)
+    if html is None:
+        return None, href, throttled
+    pdata = product_from_ld(_RE_LD_SCRIPT.findall(html))
+    if not pdata or not pdata["title"] or pdata["in_stock"] is None:
+        return None, href, False
+    if not pdata["color"]:
+        pdata["color"] = extract_color("", [], pdata["title"])
+    return pdata, final_url, False
+
+
+async def _render_detail(page, href: str, timeout_ms: int) -> Tuple[Optional[Dict[str, Any]], str]:
+    """浏览器渲染 PDP 后解析（HTTP 路径取不全时的兜底）。"""
+    try:
+        # 至少等到 DOM 解析完成（ld+json 随 HTML 下发），再短暂等待商品数据就绪；不等图片等 load 事件
+        await page.goto(href, wait_until="domcontentloaded", timeout=timeout_ms)
+        try:
+            await page.wait_for_function(_PDP_READY_JS, arg=sorted(_SIZE_LABELS), timeout=3000)
+        except PWTimeout:
+            pass
+        return await parse_product_detail(page), page.url
+    except Exception as e:
+        print(f"[detail] error {href}: {e}")
+        return None, href
+
+
+def _finish_detail(pdata: Dict[str, Any], final_url: str, keyword: str) -> Optional[Dict[str, Any]]:
+    """补全 url/key/last_seen/指纹；被关键词过滤或无标题时返回 None。"""
+    if keyword and keyword not in (pdata.get("title") or "").lower():
+        return None
 
-            empty_hits = 0
-            for href in links:
-                if href in seen:
-                    continue
-                seen.add(href)
-                safe_sleep()
+    slug = slug_from_pdp_url(final_url)
+    key = stable_key_from_url(final_url)
+    display_url = f"https://www.als.com/{slug}/p" if slug else final_url.split("?")[0].split("#")[0]
 
+    pdata.update({"url": display_url, "last_seen": now_iso(), "key": key})
+    pdata["_fp"] = product_fingerprint(pdata)
+    # 只有有标题才算有效商品，避免空噪声
+    return pdata if pdata["title"] else None
+
+
+class BrowserUnavailable(RuntimeError):
+    """Chromium 启动失败（本次运行不再重试）。"""
+
+
+class BrowserPool:
+    """按需启动 Chromium：只有纯 HTTP 取不到数据时才启动，并维护同一上下文下的 page 池。"""
+
+    def __init__(self, pw, headless: bool, timeout_ms: int, size: int) -> None:
+        self.pw = pw
+        self.headless = headless
+        self.timeout_ms = timeout_ms
+        self.size = max(1, size)
+        self.ctx = None
+        self._pages: Optional["asyncio.Queue[Any]"] = None
+        self._error: Optional[BaseException] = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            # 启动失败只尝试一次：之后的任务直接失败，不再反复拉起浏览器
+            if self._error is not None:
+                raise BrowserUnavailable(repr(self._error)) from self._error
+            if self._pages is None:
+                print("[browser] launching chromium for rendered fallback")
                 try:
-                    page.goto(href)
-                    page.wait_for_load_state("domcontentloaded")
-                    safe_sleep()
-                    final_url = page.url
-                    pdata = parse_product_detail(page)
-
-                    if keyword and keyword not in (pdata.get("title") or "").lower():
-                        continue
-
-                    slug = slug_from_pdp_url(final_url)
-                    key = stable_key_from_url(final_url)
-                    display_url = f"https://www.als.com/{slug}/p" if slug else final_url.split("?")[0].split("#")[0]
-
-                    pdata.update({"url": display_url, "last_seen": now_iso(), "key": key})
-                    # 只有有标题才算有效商品，避免空噪声
-                    if pdata["title"]:
-                        result[key] = pdata
+                    # 持久化上下文：HTTP 缓存/cookie 跨次运行复用（CI 中由 actions/cache 保存该目录）
+                    self.ctx = await self.pw.chromium.launch_persistent_context(
+                        user_data_dir=PW_USER_DATA_DIR, headless=self.headless,
+                        user_agent=USER_AGENT, locale="en-US")
+                    await _setup_context(self.ctx, self.timeout_ms)
+                    pages: "asyncio.Queue[Any]" = asyncio.Queue()
+                    # 持久化上下文自带一个空白页，一并纳入池中
+                    for page in self.ctx.pages[:self.size]:
+                        pages.put_nowait(page)
+                    for _ in range(self.size - pages.qsize()):
+                        pages.put_nowait(await self.ctx.new_page())
                 except Exception as e:
-                    print(f"[detail] error {href}: {e}")
-            page_idx += 1
+                    print(f"[browser] launch failed: {e!r}")
+                    self._error = e
+                    await self.close()
+                    self.ctx = None
+                    raise BrowserUnavailable(repr(e)) from e
+                self._pages = pages
+        # 池的大小即渲染并发上限
+        return await self._pages.get()
+
+    def release(self, page) -> None:
+        self._pages.put_nowait(page)
+
+    async def close(self) -> None:
+        # 持久化上下文关闭时浏览器一并退出
+        if self.ctx is not None:
+            try:
+                await self.ctx.close()
+            except Exception as e:
+                print(f"[browser] close error: {e!r}")
+
+
+def _listing_unchanged(item: Dict[str, Any], o: Dict[str, Any]) -> bool:
+    """集合页只显示一个价格且与快照一致、且有货：可以跳过 PDP，直接沿用快照。"""
+    prices = item["prices"]
+    return (len(prices) == 1 and o.get("price") is not None
+            and abs(prices[0] - o["price"]) < 0.01
+            and not item["oos"] and bool(o.get("in_stock")))
+
+
+async def _scrape_all_products(headless: bool, timeout_ms: int, workers: int,
+                               old: Dict[str, Any]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    keyword = os.environ.get("KEYWORD_FILTER", "").strip().lower()
+    limiter = HostRateLimiter(float(os.environ.get("ALS_MIN_INTERVAL_SEC", "0.1")))
+
+    async with async_playwright() as pw:
+        # 纯 HTTP 客户端（不启动浏览器）；浏览器仅在兜底时按需启动
+        http = await pw.request.new_context(user_agent=USER_AGENT, extra_http_headers={"Accept-Language": "en-US"})
+        browsers = BrowserPool(pw, headless, timeout_ms, workers)
+
+        async def http_links(url: str) -> List[Dict[str, Any]]:
+            html, final_url, _ = await _http_get(http, url, timeout_ms, limiter)
+            return extract_collection_links_html(html, final_url) if html else []
 
-        ctx.close()
-        browser.close()
+        async def rendered_links(url: str) -> List[Dict[str, Any]]:
+            page = await browsers.acquire()
+            try:
+                await page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+                return await extract_collection_links(page)
+            finally:
+                browsers.release(page)
+
+        links = await _collect_links(http_links)
+        if not links:
+            # 集合页不是服务端渲染（或被拦截）：改用浏览器翻页
+            links = await _collect_links(rendered_links)
+
+        http_sem = asyncio.Semaphore(max(1, workers))
+
+        async def bounded(href: str, o: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            # 先走纯 HTTP（不渲染）；ld+json 取不全时再借 page 渲染
+            async with http_sem:
+                pdata, final_url, throttled = await _fetch_detail_http(http, href, timeout_ms, limiter)
+            if throttled:
+                # 重试后仍被限流：渲染同样会被限流，本次沿用快照（没有快照则跳过）
+                return dict(o, last_seen=now_iso()) if o else None
+            if pdata is None:
+                try:
+                    page = await browsers.acquire()
+                except BrowserUnavailable:
+                    # 浏览器起不来：不影响其他商品，本次沿用快照（没有快照则跳过）
+                    return dict(o, last_seen=now_iso()) if o else None
+                try:
+                    await limiter.wait()
+                    pdata, final_url = await _render_detail(page, href, timeout_ms)
+                finally:
+                    browsers.release(page)
+            return _finish_detail(pdata, final_url, keyword) if pdata else None
+
+        # 分诊：新商品、集合页价格变了、快照里缺货（可能到货）或卡片显示缺货的才进 PDP；
+        # 其余沿用快照（只更新 last_seen）
+        triage = os.environ.get("LISTING_TRIAGE", "1") != "0"
+
+        async def carry(o: Dict[str, Any]) -> Dict[str, Any]:
+            return dict(o, last_seen=now_iso())
+
+        jobs, visits = [], 0
+        for item in links:
+            o = old.get(stable_key_from_url(item["href"]))
+            if (triage and o and _listing_unchanged(item, o)
+                    and (not keyword or keyword in (o.get("title") or "").lower())):
+                jobs.append(carry(o))
+            else:
+                jobs.append(bounded(item["href"], o))
+                visits += 1
+        print(f"[triage] visiting {visits} of {len(links)} PDPs")
+
+        try:
+            # gather 按 links 顺序返回，快照/通知顺序与集合页一致（不受完成先后影响）
+            for pdata in await asyncio.gather(*jobs):
+                if pdata:
+                    result[pdata["key"]] = pdata
+        finally:
+            await http.dispose()
+            await browsers.close()
 
     return result
 
+
+def scrape_all_products(headless: bool = True, timeout_ms: int = 8000, workers: int = 8,
+                        old: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    集合页翻页直到连续2页无链接；集合页卡片与快照 old 一致的商品不进 PDP（沿用快照）。
+    PDP 并发抓取：优先直接取 HTML 解析 ld+json，
+    取不全再按需启动浏览器，由同一上下文中的 workers 个页面渲染解析。
+    仅保留必要逻辑：拦截静态资源以提速；每个 PDP 尝试 1 次。
+    key = 稳定 slug。
+    """
+    return asyncio.run(_scrape_all_products(headless, timeout_ms, workers, old or {}))
+
 # --------------------------
 # 差异与通知
 # --------------------------
 
 def compute_diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
     """
-    返回：
-      new_items:     [(k, n)]
-      price_changes: [(k, o, n)]
-      restocks:      [(k, o, n)]
+    单次遍历 new（保持抓取顺序），返回：
+      new_items:     {k: n}
+      price_changes: {k: (o, n)}
+      restocks:      {k: (o, n)}
     """
-    new_items: List[Tuple[str, Dict[str, Any]]] = []
-    price_changes: List[Tuple[str, Dict[str, Any], Dict[str, Any]]] = []
-    restocks: List[Tuple[str, Dict[str, Any], Dict[str, Any]]] = []
-
-    old_keys, new_keys = set(old.keys()), set(new.keys())
-
-    # 上新（新商品/新变体）
-    for k in sorted(new_keys - old_keys):
-        new_items.append((k, new[k]))
+    new_items: Dict[str, Dict[str, Any]] = {}
+    price_changes: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    restocks: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+
+    for k, n in new.items():
+        # 上新（新商品/新变体）
+        if k not in old:
+            new_items[k] = n
+            continue
+        o = old[k]
 
-    # 交集对比
-    for k in sorted(new_keys & old_keys):
-        o, n = old.get(k, {}), new.get(k, {})
+        # 指纹一致 ⇒ 价格/库存均未变，直接跳过
+        fp = n.get("_fp")
+        if fp is not None and fp == o.get("_fp"):
+            continue
 
-        # 价格变化（双边都是数字且差值>=0.01）
+        # 价格变化（双边都有价格且差值>=0.01；价格类型在解析时已保证为 float/None）
         op, np = o.get("price"), n.get("price")
-        if (isinstance(op, (int, float)) and not math.isnan(op)
-            and isinstance(np, (int, float)) and not math.isnan(np)
-            and abs(op - np) >= 0.01):
-            price_changes.append((k, o, n))
+        if op is not None and np is not None and abs(op - np) >= 0.01:
+            price_changes[k] = (o, n)
 
         # 仅提醒 缺货 → 到货
         if (not o.get("in_stock", False)) and n.get("in_stock", False):
-            restocks.append((k, o, n))
+            restocks[k] = (o, n)
 
     return {
         "new_items": new_items,
@@ -404,18 +867,54 @@ def build_item_message(n: Dict[str, Any], reasons: List[str]) -> Dict[str, Any]:
         "embeds": [{
             "title": "Al's | Arc'teryx 监控",
             "description": content[:4000],
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now_iso(),
             "color": 0x00AAFF,
             "footer": {"text": "als.com 上新 / 价格 / 到货"},
         }]
     }
 
 
-def send_discord(payload: dict) -> None:
-    """简化 webhook：单次尝试，7s 超时；不带 Origin/Referer。"""
-    import urllib.request
-    import urllib.error
+def _embed_chars(embed: Dict[str, Any]) -> int:
+    return (len(embed.get("title") or "") + len(embed.get("description") or "")
+            + len((embed.get("footer") or {}).get("text") or ""))
 
+
+def batch_payloads(payloads: List[Dict[str, Any]], max_embeds: int = 10,
+                   max_chars: int = 6000) -> List[Dict[str, Any]]:
+    """把多条单品通知合并为多 embed 请求（Discord 每次最多 10 个 embed、合计 6000 字符）。"""
+    batches: List[Dict[str, Any]] = []
+    embeds: List[Dict[str, Any]] = []
+    chars = 0
+    for p in payloads:
+        for e in p.get("embeds") or []:
+            size = _embed_chars(e)
+            if embeds and (len(embeds) >= max_embeds or chars + size > max_chars):
+                batches.append({"content": None, "embeds": embeds})
+                embeds, chars = [], 0
+            embeds.append(e)
+            chars += size
+    if embeds:
+        batches.append({"content": None, "embeds": embeds})
+    return batches
+
+
+def _discord_conn(host: str) -> http.client.HTTPSConnection:
+    """按 host 复用 keep-alive 连接，避免每条通知都重新握手 TCP+TLS。"""
+    conn = _DISCORD_CONNS.get(host)
+    if conn is None:
+        conn = http.client.HTTPSConnection(host, timeout=7)
+        _DISCORD_CONNS[host] = conn
+    return conn
+
+
+def _drop_discord_conn(host: str) -> None:
+    conn = _DISCORD_CONNS.pop(host, None)
+    if conn is not None:
+        conn.close()
+
+
+def send_discord(payload: dict) -> None:
+    """简化 webhook：复用连接，7s 超时；429/5xx 退避重试（连接错误仅在空闲连接被关闭时重试），按 Discord 限速头等待；不带 Origin/Referer。"""
     webhook = os.environ.get("DISCORD_WEBHOOK_URL", "").strip()
     if not webhook:
         print("WARN: DISCORD_WEBHOOK_URL 未配置，跳过通知。")
@@ -425,7 +924,9 @@ def send_discord(payload: dict) -> None:
     if "?" not in webhook:
         webhook = webhook + "?wait=true"
 
-    data = json.dumps(payload).encode("utf-8")
+    u = urlparse(webhook)
+    target = u.path + (f"?{u.query}" if u.query else "")
+    data = orjson.dumps(payload)
     headers = {
         "Content-Type": "application/json",
         "Accept": "application/json",
@@ -433,18 +934,55 @@ def send_discord(payload: dict) -> None:
                        "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0 Safari/537.36"),
     }
 
-    try:
-        req = urllib.request.Request(webhook, data=data, headers=headers, method="POST")
-        with urllib.request.urlopen(req, timeout=7) as resp:
+    # 同一 bucket 额度耗尽时，等到重置再发（只在下一次发送前等，不在最后一条之后空等）
+    bucket = _DISCORD_BUCKETS.get(u.path, u.path)
+    delay = _DISCORD_RESUME_AT.get(bucket, 0.0) - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+    resp = None
+    for attempt in range(DISCORD_RETRIES + 1):
+        conn = _discord_conn(u.netloc)
+        try:
+            conn.request("POST", target, body=data, headers=headers)
+            resp = conn.getresponse()
             body = resp.read().decode("utf-8", "ignore")
-            print(f"Discord OK: {resp.status} {body[:120]}")
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8", "ignore")
-        print(f"Discord HTTPError: {e.code} {body[:200]}")
-    except Exception as ex:
-        print(f"Discord error: {repr(ex)}")
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as ex:
+            # 空闲 keep-alive 连接被服务端关闭：换新连接重试（首次立即重试）
+            _drop_discord_conn(u.netloc)
+            if attempt >= DISCORD_RETRIES:
+                print(f"Discord error: {repr(ex)}")
+                return
+            if attempt:
+                time.sleep(backoff_delay(attempt - 1))
+            continue
+        except (http.client.HTTPException, OSError) as ex:
+            # 超时等其他错误：消息可能已被 Discord 发出，不重试以免重复通知
+            _drop_discord_conn(u.netloc)
+            print(f"Discord error: {repr(ex)}")
+            return
+
+        # 429 / 5xx：按 Retry-After（或指数退避）等待后重试，避免丢通知
+        if (resp.status == 429 or resp.status >= 500) and attempt < DISCORD_RETRIES:
+            wait = retry_after_sec(resp.getheader) or backoff_delay(attempt)
+            print(f"Discord {resp.status}; retry {attempt + 1}/{DISCORD_RETRIES} in {wait:.1f}s")
+            time.sleep(wait)
+            continue
+        break
+
+    if 200 <= resp.status < 300:
+        print(f"Discord OK: {resp.status} {body[:120]}")
+    else:
+        print(f"Discord HTTPError: {resp.status} {body[:200]}")
 
-    time.sleep(float(os.environ.get("NOTIFY_INTERVAL_SEC", "0.1")))
+    # 记录该 bucket 的下次可发送时刻：仅在额度耗尽时才需要等待
+    bucket = resp.getheader("X-RateLimit-Bucket") or bucket
+    _DISCORD_BUCKETS[u.path] = bucket
+    wait = 0.0
+    if resp.getheader("X-RateLimit-Remaining") == "0":
+        wait = retry_after_sec(resp.getheader)
+    wait = max(wait, float(os.environ.get("NOTIFY_INTERVAL_SEC", "0")))
+    _DISCORD_RESUME_AT[bucket] = time.monotonic() + wait
 
 # --------------------------
 # 主流程
@@ -457,31 +995,31 @@ def main() -> int:
     old = jload(SNAPSHOT_PATH)
     print(f"Loaded {len(old)} items from snapshot.")
 
-    new = scrape_all_products(headless=headless)
+    workers = int(os.environ.get("SCRAPE_CONCURRENCY", "8"))
+    new = scrape_all_products(headless=headless, workers=workers, old=old)
     print(f"Scraped {len(new)} items from website.")
 
     diffs = compute_diff(old, new)
 
     # 合并为“每商品一条”的原因列表
     reasons_map: Dict[str, List[str]] = {}
-    for k, _n in diffs["new_items"]:
-        reasons_map.setdefault(k, []).append("上新")
-    for k, _o, _n in diffs["price_changes"]:
-        reasons_map.setdefault(k, []).append("价格变化")
-    for k, _o, _n in diffs["restocks"]:
-        reasons_map.setdefault(k, []).append("缺货→到货")
-
-    changed_keys = sorted(set(reasons_map.keys()))
+    for reason, bucket in (("上新", diffs["new_items"]),
+                           ("价格变化", diffs["price_changes"]),
+                           ("缺货→到货", diffs["restocks"])):
+        for k in bucket:
+            reasons_map.setdefault(k, []).append(reason)
+
+    changed_keys = list(reasons_map)
     print("Changed items:", len(changed_keys))
 
     # 先写回快照（确保下次对比有基线）
     jdump(new, SNAPSHOT_PATH)
 
-    # 只给有变化的商品发通知（一个商品一条）
+    # 只给有变化的商品发通知（一个商品一条 embed，多条合并成一次请求）
     if changed_keys:
-        for k in changed_keys:
-            n = new.get(k) or {}
-            payload = build_item_message(n, reasons=reasons_map.get(k, []))
+        payloads = [build_item_message(new.get(k) or {}, reasons=reasons_map.get(k, []))
+                     for k in changed_keys]
+        for payload in batch_payloads(payloads):
             send_discord(payload)
     else:
         print("No changes; no notifications.")